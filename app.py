@@ -1,34 +1,104 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, abort, make_response, session
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
+from flask_compress import Compress
+from sqlalchemy import func, event, text, make_url, DDL
+from werkzeug.security import check_password_hash
+from jinja2 import FileSystemBytecodeCache
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from cachetools import cached, TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import wraps, lru_cache
+import hashlib
+import threading
 import os
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///msme.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_pre_ping': True,
+    'pool_recycle': 1800,
+}
+# SQLite may get a StaticPool (in-memory URLs), which rejects queue pool sizing
+if make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name() != 'sqlite':
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].update({
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+    })
 
-db = SQLAlchemy(app)
+# Cache compiled templates on disk so fresh workers skip parsing
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(os.environ.get('JINJA_CACHE_DIR'))
+
+# Compress HTML responses
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+Compress(app)
+
+# Keep loaded attributes after commit; handlers redirect right after writing
+db = SQLAlchemy(app, session_options={'expire_on_commit': False})
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
+# SQLite: WAL lets reads proceed during a write, and NORMAL sync is safe under WAL
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA mmap_size=268435456')
+    cursor.close()
+
+with app.app_context():
+    if db.engine.url.get_backend_name() == 'sqlite':
+        event.listen(db.engine, 'connect', set_sqlite_pragmas)
+
+# Argon2id parameters (OWASP recommended minimum)
+password_hasher = PasswordHasher(time_cost=3, memory_cost=46 * 1024, parallelism=1)
+# Verified on unknown usernames so they cost the same as a wrong password
+DUMMY_PASSWORD_HASH = password_hasher.hash('dummy-password')
+# Each hash needs 46 MiB and a full core. Every gunicorn worker gets its own
+# pool, so split the cores between WEB_CONCURRENCY workers by default
+hash_pool = ThreadPoolExecutor(max_workers=int(os.environ.get(
+    'HASH_POOL_SIZE',
+    max(1, (os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY', 1)))
+)))
+
 # Models
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
+    username = db.Column(db.String(80), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(20), nullable=False)
-    products = db.relationship('Product', backref='supplier', lazy=True, cascade='all, delete-orphan')
+    products = db.relationship('Product', backref=db.backref('supplier', lazy='joined'), lazy=True, cascade='all, delete-orphan')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # Legacy Werkzeug hashes are verified once and upgraded to Argon2id
+        if self.password_hash.startswith(('pbkdf2:', 'scrypt:')):
+            if not check_password_hash(self.password_hash, password):
+                return False
+            self.set_password(password)
+            return True
+
+        try:
+            password_hasher.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+        if password_hasher.check_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
 
 class Product(db.Model):
+    __table_args__ = (
+        db.Index('ix_product_cat_price', 'category', 'price'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
@@ -36,11 +106,30 @@ class Product(db.Model):
     category = db.Column(db.String(100), nullable=False)
     min_order_qty = db.Column(db.Integer, nullable=False)
     image_filename = db.Column(db.String(200))
-    supplier_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    # Set in Python for sub-second precision; the server default covers rows written
+    # elsewhere. Existing databases need the column added by hand:
+    #   SQLite:     ALTER TABLE product ADD COLUMN updated_at DATETIME NOT NULL DEFAULT '1970-01-01 00:00:00';
+    #   PostgreSQL: ALTER TABLE product ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT now();
+    #   Both:       CREATE INDEX ix_product_updated_at ON product (updated_at);
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=func.now(), index=True)
+
+# Full-text index for keyword search (PostgreSQL only; other backends use LIKE).
+# Queries must repeat the indexed expression verbatim for the planner to use it.
+# The index is only created along with a new product table; existing databases need:
+#   CREATE INDEX ix_product_fts ON product USING GIN (to_tsvector('english', name || ' ' || description));
+PRODUCT_SEARCH_VECTOR = "to_tsvector('english', name || ' ' || description)"
+
+event.listen(
+    Product.__table__,
+    'after_create',
+    DDL(f'CREATE INDEX ix_product_fts ON product USING GIN ({PRODUCT_SEARCH_VECTOR})').execute_if(dialect='postgresql')
+)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return db.session.get(User, int(user_id))
 
 # Role-based decorator
 def role_required(role):
@@ -54,6 +143,74 @@ def role_required(role):
         return decorated_function
     return decorator
 
+@lru_cache(maxsize=None)
+def static_file_hash(path, mtime):
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()[:12]
+
+@app.url_defaults
+def add_static_fingerprint(endpoint, values):
+    if endpoint == 'static' and 'filename' in values:
+        path = os.path.join(app.static_folder, values['filename'])
+        if os.path.isfile(path):
+            values['v'] = static_file_hash(path, os.path.getmtime(path))
+
+@app.after_request
+def mark_static_immutable(response):
+    # Fingerprinted URLs change with the file's content, so browsers may keep them for a year
+    if request.endpoint == 'static' and 'v' in request.args:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = 31536000
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
+
+# Answer with 304 when the client's copy is current, otherwise render the page.
+# Pages include per-user markup, so they may only be cached privately.
+def conditional_response(etag, render):
+    # Flask-Compress appends ':<algorithm>' to the ETags it sends
+    client_etags = {tag.split(':', 1)[0] for tag in request.if_none_match}
+    if etag in client_etags and not session.get('_flashes'):
+        response = app.response_class(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# Category list for the search filter; cleared whenever products change
+@cached(TTLCache(maxsize=1, ttl=60), lock=threading.Lock())
+def get_categories():
+    rows = db.session.query(Product.category).group_by(Product.category).all()
+    return [row[0] for row in rows]
+
+# Product detail rows keyed by id. The TTL bounds staleness in other workers,
+# since edits and deletes only evict from the local process.
+product_cache = TTLCache(maxsize=1024, ttl=30)
+product_cache_lock = threading.Lock()
+
+def get_product(id):
+    with product_cache_lock:
+        product = product_cache.get(id)
+    if product is None:
+        row = Product.query.join(Product.supplier).with_entities(
+            Product.id, Product.name, Product.description, Product.price, Product.category,
+            Product.min_order_qty, Product.image_filename, Product.supplier_id, Product.updated_at,
+            User.username.label('supplier_username')
+        ).filter(Product.id == id).first()
+        if row is None:
+            abort(404)
+        product = row._asdict()
+        with product_cache_lock:
+            product_cache[id] = product
+    return product
+
+def forget_products(*ids):
+    with product_cache_lock:
+        for id in ids:
+            product_cache.pop(id, None)
+
 # Initialize database and create admin
 def init_db():
     with app.app_context():
@@ -90,18 +247,18 @@ def register():
         
         if not username or not password or not role:
             flash('All fields are required.', 'danger')
-            return redirect(url_for('register'))
+            return render_template('register.html'), 400
         
         if role not in ['supplier', 'buyer']:
             flash('Invalid role selected.', 'danger')
-            return redirect(url_for('register'))
+            return render_template('register.html'), 400
         
-        if User.query.filter_by(username=username).first():
+        if db.session.query(User.id).filter_by(username=username).first() is not None:
             flash('Username already exists.', 'danger')
-            return redirect(url_for('register'))
+            return render_template('register.html'), 400
         
         user = User(username=username, role=role)
-        user.set_password(password)
+        hash_pool.submit(user.set_password, password).result()
         db.session.add(user)
         db.session.commit()
         
@@ -117,11 +274,22 @@ def login():
     
     if request.method == 'POST':
         username = request.form.get('username')
-        password = request.form.get('password')
+        password = request.form.get('password', '')
         
         user = User.query.filter_by(username=username).first()
         
-        if user and user.check_password(password):
+        if user:
+            authenticated = hash_pool.submit(user.check_password, password).result()
+        else:
+            try:
+                hash_pool.submit(password_hasher.verify, DUMMY_PASSWORD_HASH, password).result()
+            except VerificationError:
+                pass
+            authenticated = False
+        
+        if authenticated:
+            # Persist the hash if check_password upgraded it
+            db.session.commit()
             login_user(user)
             flash('Login successful!', 'success')
             return redirect(url_for('index'))
@@ -142,37 +310,67 @@ def logout():
 @login_required
 @role_required('admin')
 def admin_dashboard():
-    users = User.query.all()
-    products = Product.query.all()
-    total_users = len(users)
-    total_products = len(products)
-    total_suppliers = User.query.filter_by(role='supplier').count()
-    total_buyers = User.query.filter_by(role='buyer').count()
+    page = request.args.get('page', 1, type=int)
+    users = User.query.with_entities(User.id, User.username, User.role) \
+        .order_by(User.id).paginate(page=page, per_page=50, error_out=False)
+    products = Product.query.join(Product.supplier).with_entities(
+        Product.id, Product.name, Product.category, Product.price,
+        User.username.label('supplier_username')
+    ).all()
+    # All dashboard totals in one round-trip
+    totals = db.session.execute(db.select(
+        db.select(func.count(User.id)).scalar_subquery().label('users'),
+        db.select(func.count(Product.id)).scalar_subquery().label('products'),
+        db.select(func.count(User.id)).where(User.role == 'supplier').scalar_subquery().label('suppliers'),
+        db.select(func.count(User.id)).where(User.role == 'buyer').scalar_subquery().label('buyers'),
+    )).one()
     
     return render_template('admin_dashboard.html', 
                          users=users, 
                          products=products,
-                         total_users=total_users,
-                         total_products=total_products,
-                         total_suppliers=total_suppliers,
-                         total_buyers=total_buyers)
+                         total_users=totals.users,
+                         total_products=totals.products,
+                         total_suppliers=totals.suppliers,
+                         total_buyers=totals.buyers)
 
-@app.route('/admin/product/delete/<int:id>')
+@app.route('/admin/product/delete/<int:id>', methods=['POST'])
 @login_required
 @role_required('admin')
 def admin_delete_product(id):
-    product = Product.query.get_or_404(id)
-    db.session.delete(product)
+    deleted = Product.query.filter_by(id=id).delete(synchronize_session=False)
+    if not deleted:
+        abort(404)
     db.session.commit()
+    get_categories.cache_clear()
+    forget_products(id)
     flash('Product deleted successfully.', 'success')
     return redirect(url_for('admin_dashboard'))
 
+@app.route('/admin/products/delete', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_delete_products():
+    ids = request.form.getlist('product_ids', type=int)
+    
+    if not ids:
+        flash('No products selected.', 'danger')
+        return redirect(url_for('admin_dashboard'))
+    
+    deleted = Product.query.filter(Product.id.in_(ids)).delete(synchronize_session=False)
+    db.session.commit()
+    get_categories.cache_clear()
+    forget_products(*ids)
+    flash(f'{deleted} product(s) deleted successfully.', 'success')
+    return redirect(url_for('admin_dashboard'))
+
 # Supplier Dashboard
 @app.route('/supplier/dashboard')
 @login_required
 @role_required('supplier')
 def supplier_dashboard():
-    products = Product.query.filter_by(supplier_id=current_user.id).all()
+    products = Product.query.filter_by(supplier_id=current_user.id).with_entities(
+        Product.id, Product.name, Product.category, Product.price, Product.min_order_qty
+    ).all()
     return render_template('supplier_dashboard.html', products=products)
 
 @app.route('/supplier/product/add', methods=['GET', 'POST'])
@@ -189,7 +387,7 @@ def add_product():
         
         if not all([name, description, price, category, min_order_qty]):
             flash('All fields except image are required.', 'danger')
-            return redirect(url_for('add_product'))
+            return render_template('product_form.html', product=request.form, action='Add'), 400
         
         try:
             product = Product(
@@ -203,11 +401,12 @@ def add_product():
             )
             db.session.add(product)
             db.session.commit()
+            get_categories.cache_clear()
             flash('Product added successfully!', 'success')
             return redirect(url_for('supplier_dashboard'))
         except ValueError:
             flash('Invalid price or quantity value.', 'danger')
-            return redirect(url_for('add_product'))
+            return render_template('product_form.html', product=request.form, action='Add'), 400
     
     return render_template('product_form.html', product=None, action='Add')
 
@@ -215,38 +414,56 @@ def add_product():
 @login_required
 @role_required('supplier')
 def edit_product(id):
-    product = Product.query.get_or_404(id)
+    product = db.get_or_404(Product, id)
     
     if product.supplier_id != current_user.id:
         flash('Access denied.', 'danger')
         return redirect(url_for('supplier_dashboard'))
     
     if request.method == 'POST':
-        product.name = request.form.get('name')
-        product.description = request.form.get('description')
-        product.price = float(request.form.get('price'))
-        product.category = request.form.get('category')
-        product.min_order_qty = int(request.form.get('min_order_qty'))
+        name = request.form.get('name')
+        description = request.form.get('description')
+        price = request.form.get('price')
+        category = request.form.get('category')
+        min_order_qty = request.form.get('min_order_qty')
+        
+        if not all([name, description, price, category, min_order_qty]):
+            flash('All fields except image are required.', 'danger')
+            return render_template('product_form.html', product=request.form, action='Edit'), 400
+        
+        try:
+            price = float(price)
+            min_order_qty = int(min_order_qty)
+        except ValueError:
+            flash('Invalid price or quantity value.', 'danger')
+            return render_template('product_form.html', product=request.form, action='Edit'), 400
+        
+        product.name = name
+        product.description = description
+        product.price = price
+        product.category = category
+        product.min_order_qty = min_order_qty
         product.image_filename = request.form.get('image_filename')
         
         db.session.commit()
+        get_categories.cache_clear()
+        forget_products(id)
         flash('Product updated successfully!', 'success')
         return redirect(url_for('supplier_dashboard'))
     
     return render_template('product_form.html', product=product, action='Edit')
 
-@app.route('/supplier/product/delete/<int:id>')
+@app.route('/supplier/product/delete/<int:id>', methods=['POST'])
 @login_required
 @role_required('supplier')
 def delete_product(id):
-    product = Product.query.get_or_404(id)
+    deleted = Product.query.filter_by(id=id, supplier_id=current_user.id).delete(synchronize_session=False)
+    if not deleted:
+        abort(404)
     
-    if product.supplier_id != current_user.id:
-        flash('Access denied.', 'danger')
-        return redirect(url_for('supplier_dashboard'))
-    
-    db.session.delete(product)
     db.session.commit()
+    get_categories.cache_clear()
+    forget_products(id)
     flash('Product deleted successfully.', 'success')
     return redirect(url_for('supplier_dashboard'))
 
@@ -255,30 +472,51 @@ def delete_product(id):
 @login_required
 @role_required('buyer')
 def buyer_dashboard():
-    products = Product.query.all()
-    return render_template('buyer_dashboard.html', products=products)
+    page = request.args.get('page', 1, type=int)
+    # Any insert, edit or delete changes either the product count or the latest update time
+    total, last_updated = db.session.query(func.count(Product.id), func.max(Product.updated_at)).one()
+    etag = f'{current_user.id}-{page}-{total}-{last_updated.timestamp() if last_updated else 0}'
+    
+    def render():
+        # Cards only show a 100 character preview, so don't fetch the full description
+        products = Product.query.join(Product.supplier).with_entities(
+            Product.id, Product.name, Product.category, Product.price, Product.min_order_qty,
+            Product.image_filename, func.substr(Product.description, 1, 101).label('description'),
+            User.username.label('supplier_username')
+        ).order_by(Product.id.desc()).paginate(page=page, per_page=24, error_out=False, count=False)
+        # Reuse the ETag's count instead of counting again
+        products.total = total
+        return render_template('buyer_dashboard.html', products=products)
+    
+    return conditional_response(etag, render)
 
 @app.route('/product/<int:id>')
 @login_required
 def view_product(id):
-    product = Product.query.get_or_404(id)
-    return render_template('product_view.html', product=product)
+    product = get_product(id)
+    etag = f"{product['id']}-{product['updated_at'].timestamp()}-{current_user.id}"
+    return conditional_response(etag, lambda: render_template('product_view.html', product=product))
 
 # Search
 @app.route('/search')
 @login_required
 def search():
-    keyword = request.args.get('keyword', '')
+    keyword = request.args.get('keyword', '').strip()[:80]
     category = request.args.get('category', '')
     sort_by = request.args.get('sort', '')
     
     query = Product.query
     
     if keyword:
-        query = query.filter(
-            (Product.name.contains(keyword)) | 
-            (Product.description.contains(keyword))
-        )
+        if db.engine.dialect.name == 'postgresql':
+            query = query.filter(
+                text(f"{PRODUCT_SEARCH_VECTOR} @@ plainto_tsquery('english', :keyword)").bindparams(keyword=keyword)
+            )
+        else:
+            query = query.filter(
+                (Product.name.contains(keyword, autoescape=True)) | 
+                (Product.description.contains(keyword, autoescape=True))
+            )
     
     if category:
         query = query.filter_by(category=category)
@@ -288,9 +526,9 @@ def search():
     elif sort_by == 'price_high':
         query = query.order_by(Product.price.desc())
     
-    products = query.all()
-    categories = db.session.query(Product.category).distinct().all()
-    categories = [c[0] for c in categories]
+    page = request.args.get('page', 1, type=int)
+    products = query.order_by(Product.id.desc()).paginate(page=page, per_page=24, error_out=False)
+    categories = get_categories()
     
     return render_template('search.html', 
                          products=products, 